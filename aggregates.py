@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Mergeable Partial Aggregates
+Combines per-shard partial results into population-wide statistics
+"""
+
+import heapq
+import math
+import numpy as np
+
+
+def merge_moments(a, b):
+    """Combine two (count, mean, m2) summaries with Chan's parallel formula"""
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    return {
+        'count': count,
+        'mean': a['mean'] + delta * b['count'] / count,
+        'm2': a['m2'] + b['m2'] + delta * delta * a['count'] * b['count'] / count,
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max'])
+    }
+
+
+def merge_cohort_partials(partials):
+    """Merge count/mean/m2/min/max per fitness level and metric"""
+    merged = {}
+    for partial in partials:
+        for cohort, metrics in partial.items():
+            cohort_merged = merged.setdefault(cohort, {})
+            for metric, stats in metrics.items():
+                if metric in cohort_merged:
+                    cohort_merged[metric] = merge_moments(cohort_merged[metric], stats)
+                else:
+                    cohort_merged[metric] = dict(stats)
+
+    return merged
+
+
+def finalize_cohort_stats(partial):
+    """Turn a (merged) cohort partial into count/mean/std/min/max"""
+    stats = {}
+    for cohort, metrics in partial.items():
+        stats[cohort] = {}
+        for metric, p in metrics.items():
+            count = p['count']
+            stats[cohort][metric] = {
+                'count': count,
+                'mean': p['mean'],
+                'std': math.sqrt(p['m2'] / (count - 1)) if count > 1 else None,
+                'min': p['min'],
+                'max': p['max']
+            }
+
+    return stats
+
+
+def merge_leaderboards(partials, top_n):
+    """Keep the overall top_n entries from per-shard top_n lists"""
+    if top_n < 1:
+        raise ValueError("top_n must be at least 1")
+    entries = [entry for partial in partials for entry in partial]
+    return heapq.nlargest(top_n, entries, key=lambda e: (e['value'], e['user_id']))
+
+
+def merge_provider_partials(partials):
+    """Sum per-provider counters across shards"""
+    merged = {}
+    for partial in partials:
+        for provider, counters in partial.items():
+            if provider not in merged:
+                merged[provider] = dict(counters)
+                continue
+            for key, value in counters.items():
+                if key != 'provider_id':
+                    merged[provider][key] += value
+
+    return merged
+
+
+def finalize_provider_rollup(partial):
+    """Turn a (merged) provider partial into per-provider averages"""
+    return {
+        provider: {
+            'provider_id': p['provider_id'],
+            'users': p['users'],
+            'avg_weekly_steps': p['total_steps'] / p['users'],
+            'avg_weekly_calories': p['total_calories_burned'] / p['users'],
+            'avg_health_score': p['health_score'] / p['users'],
+            'users_over_10k_steps': p['users_over_10k_steps']
+        }
+        for provider, p in partial.items()
+    }
+
+
+def merge_workout_results(results):
+    """Combine per-shard workout-type query results"""
+    merged = dict(results[0])
+    merged['user_ids'] = sorted(user_id for r in results for user_id in r['user_ids'])
+    merged['user_count'] = len(merged['user_ids'])
+    merged['totals'] = {
+        metric: sum(r['totals'][metric] for r in results)
+        for metric in results[0]['totals']
+    }
+
+    return merged
+
+
+def merge_cooccurrence(results):
+    """Sum per-shard workout-type co-occurrence counts"""
+    merged = {}
+    for result in results:
+        for first, row in result.items():
+            merged_row = merged.setdefault(first, {})
+            for second, count in row.items():
+                merged_row[second] = merged_row.get(second, 0) + count
+
+    # Types that never met on any shard still get an explicit zero
+    for row in merged.values():
+        for workout_type in merged:
+            row.setdefault(workout_type, 0)
+
+    return merged
+
+
+def merge_peer_ranges(partials):
+    """Combine per-shard steps/calories min/max per fitness level"""
+    merged = {}
+    for partial in partials:
+        for fitness_level, ranges in partial.items():
+            if fitness_level not in merged:
+                merged[fitness_level] = {axis: list(bounds) for axis, bounds in ranges.items()}
+                continue
+            for axis, (low, high) in ranges.items():
+                bounds = merged[fitness_level][axis]
+                merged[fitness_level][axis] = [min(bounds[0], low), max(bounds[1], high)]
+
+    return merged
+
+
+def merge_peer_density(partials):
+    """Sum per-shard peer density grids per fitness level (all built on the same ranges)"""
+    merged = {}
+    for partial in partials:
+        for fitness_level, density in partial.items():
+            counts = np.asarray(density['counts'], dtype=int)
+            if fitness_level not in merged:
+                merged[fitness_level] = dict(density, counts=counts)
+                continue
+            target = merged[fitness_level]
+            if (target['steps_range'], target['calories_range']) != (density['steps_range'], density['calories_range']):
+                raise ValueError(f"Peer density grids for {fitness_level} were built on different ranges")
+            target['counts'] = target['counts'] + counts
+
+    return merged
+
+
+def merge_similar_candidates(partials, top_n):
+    """Keep the first top_n candidates by user_id from per-shard candidate lists"""
+    if top_n < 1:
+        raise ValueError("top_n must be at least 1")
+    candidates = [candidate for partial in partials for candidate in partial]
+    return sorted(candidates, key=lambda c: c['user_id'])[:top_n]
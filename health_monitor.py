@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Streaming Health Anomaly Detection
+Keeps per-user running statistics over weekly records and flags unhealthy deviations
+"""
+
+from collections import deque
+import numbers
+import numpy as np
+
+# Weekly health metrics watched by the monitor
+HEALTH_METRICS = [
+    'avg_heart_rate', 'resting_heart_rate', 'sleep_hours_total',
+    'stress_level_avg', 'sedentary_minutes'
+]
+
+# +1 when a rise is unhealthy, -1 when a drop is unhealthy
+METRIC_DIRECTIONS = np.array([1, 1, -1, 1, 1], dtype=float)
+
+# Floor on the noise scale (relative to the baseline) so flat histories don't alert on noise
+MIN_RELATIVE_STD = 0.02
+
+
+class InvalidRecordError(ValueError):
+    """Weekly record with a missing date or non-numeric metric values"""
+
+
+class StaleRecordError(ValueError):
+    """Weekly record that is not newer than the last week seen for the user"""
+
+
+class HealthMonitor:
+    def __init__(self, user_ids, z_threshold=3.5, trend_threshold=3.5,
+                 baseline_alpha=0.1, fast_alpha=0.5, min_weeks=5, rebaseline_weeks=4,
+                 max_alerts_per_user=50):
+        """Allocate array-backed running statistics for every user
+
+        The baseline is an exponentially decayed mean that forgets old weeks. Its noise
+        scale is a decayed mean of squared week-to-week changes, so a steady drift is
+        not mistaken for noise. Weeks that raise an alert are kept out of the baseline;
+        a fast EWMA of the (clipped) values is compared against it to catch trends.
+        After rebaseline_weeks consecutive flagged weeks the shift is treated as the new
+        normal and the baseline restarts at the latest value (see also acknowledge()).
+        """
+        self.user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.z_threshold = z_threshold
+        self.trend_threshold = trend_threshold
+        self.baseline_alpha = baseline_alpha
+        self.fast_alpha = fast_alpha
+        self.min_weeks = min_weeks
+        self.rebaseline_weeks = rebaseline_weeks
+        self.max_alerts_per_user = max_alerts_per_user
+
+        shape = (len(self.user_index), len(HEALTH_METRICS))
+        self.count = np.zeros(shape, dtype=np.int32)  # weeks folded into the baseline
+        self.baseline = np.zeros(shape)
+        self.diff_sq = np.zeros(shape)  # decayed mean of squared successive differences
+        self.last_value = np.full(shape, np.nan)  # last week folded into the baseline
+        self.fast = np.full(shape, np.nan)
+        self.latest_value = np.full(shape, np.nan)  # last week seen, flagged or not
+        self.flag_streak = np.zeros(shape, dtype=np.int32)  # consecutive flagged weeks
+        self.last_week = np.full(len(self.user_index), np.datetime64('NaT'), dtype='datetime64[D]')
+        self.alerts = {}
+
+    def _row(self, user_id):
+        """Look up the state row of a user"""
+        if user_id not in self.user_index:
+            raise ValueError(f"User {user_id} not found")
+        return self.user_index[user_id]
+
+    def _parse_record(self, record):
+        """Validate a weekly record into (week, metric values with NaN for missing)"""
+        try:
+            week = np.datetime64(str(record['week_start_date']), 'D')
+        except (KeyError, ValueError, TypeError):
+            raise InvalidRecordError("week_start_date must be an ISO date (YYYY-MM-DD)")
+
+        values = np.full(len(HEALTH_METRICS), np.nan)
+        for i, metric in enumerate(HEALTH_METRICS):
+            value = record.get(metric)
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            if isinstance(value, bool) or not isinstance(value, numbers.Real) or not np.isfinite(value):
+                raise InvalidRecordError(f"{metric} must be a finite number, got {value!r}")
+            values[i] = value
+
+        return week, values
+
+    def _noise_scale(self, row):
+        """Per-metric noise estimate of a user, floored relative to the baseline"""
+        sigma = np.sqrt(self.diff_sq[row] / 2)
+        sigma = np.maximum(sigma, MIN_RELATIVE_STD * np.abs(self.baseline[row]))
+        sigma[sigma == 0] = 1.0
+        return sigma
+
+    def _rebaseline(self, row, cells):
+        """Restart the baseline and fast EWMA of the given cells at their latest value"""
+        cells = cells & ~np.isnan(self.latest_value[row])
+        self.baseline[row, cells] = self.latest_value[row, cells]
+        self.last_value[row, cells] = self.latest_value[row, cells]
+        self.fast[row, cells] = self.latest_value[row, cells]
+        self.flag_streak[row, cells] = 0
+        return cells
+
+    def update(self, user_id, record):
+        """Fold one weekly record into the user's statistics and return any new alerts"""
+        row = self._row(user_id)
+        week, values = self._parse_record(record)
+        if not np.isnat(self.last_week[row]) and week <= self.last_week[row]:
+            raise StaleRecordError(
+                f"Week {week} is not newer than the last week seen for {user_id} ({self.last_week[row]})"
+            )
+        self.last_week[row] = week
+
+        present = ~np.isnan(values)
+        count = self.count[row]
+        baseline = self.baseline[row]
+        fast = self.fast[row]
+        sigma = self._noise_scale(row)
+
+        # Clip before feeding the fast EWMA so one outlier doesn't read as a trend
+        clip = self.z_threshold * sigma
+        clipped = np.where(count > 0, np.clip(values, baseline - clip, baseline + clip), values)
+        new_fast = np.where(np.isnan(fast), clipped, self.fast_alpha * clipped + (1 - self.fast_alpha) * fast)
+
+        # Score against the baseline *before* this week is considered
+        z_scores = (values - baseline) / sigma * METRIC_DIRECTIONS
+        ewma_sigma = sigma * np.sqrt(self.fast_alpha / (2 - self.fast_alpha))
+        trend_scores = (new_fast - baseline) / ewma_sigma * METRIC_DIRECTIONS
+        spikes = z_scores > self.z_threshold
+        trends = trend_scores > self.trend_threshold
+        flagged = present & (count >= self.min_weeks) & (spikes | trends)
+
+        new_alerts = []
+        for i in np.flatnonzero(flagged):
+            new_alerts.append({
+                'user_id': user_id,
+                'week_start_date': str(week),
+                'metric': HEALTH_METRICS[i],
+                'value': values[i],
+                'baseline_mean': baseline[i],
+                'ewma': new_fast[i],
+                'z_score': z_scores[i],
+                'trend_score': trend_scores[i],
+                'kind': 'spike' if spikes[i] else 'trend'
+            })
+
+        # Only unflagged weeks move the baseline, so an anomaly can't absorb itself
+        learn = present & ~flagged
+        # Plain running averages until they have seen 1/alpha weeks, decayed afterwards
+        alpha = np.maximum(1.0 / (count + 1), self.baseline_alpha)
+        diff_alpha = np.maximum(1.0 / np.maximum(count, 1), self.baseline_alpha)
+        has_diff = learn & (count > 0)
+        diff = values - self.last_value[row]
+        baseline[learn] += alpha[learn] * (values[learn] - baseline[learn])
+        self.diff_sq[row, has_diff] += diff_alpha[has_diff] * (diff[has_diff] ** 2 - self.diff_sq[row, has_diff])
+        self.last_value[row, learn] = values[learn]
+        self.count[row] = count + learn
+        self.fast[row] = np.where(present, new_fast, fast)
+        self.latest_value[row, present] = values[present]
+
+        # A shift that persists is the new normal: absorb it instead of alerting forever
+        streak = self.flag_streak[row]
+        streak[flagged] += 1
+        streak[learn] = 0
+        self._rebaseline(row, streak >= self.rebaseline_weeks)
+
+        if new_alerts:
+            user_alerts = self.alerts.setdefault(user_id, deque(maxlen=self.max_alerts_per_user))
+            user_alerts.extend(new_alerts)
+
+        return new_alerts
+
+    def update_many(self, records_df):
+        """Fold a frame of weekly records (one row per user-week, in time order)"""
+        new_alerts = []
+        for record in records_df.to_dict('records'):
+            new_alerts.extend(self.update(record['user_id'], record))
+
+        return new_alerts
+
+    def acknowledge(self, user_id, metric=None):
+        """Accept a user's current level as the new baseline for one or all metrics"""
+        row = self._row(user_id)
+        if metric is None:
+            cells = np.ones(len(HEALTH_METRICS), dtype=bool)
+        elif metric in HEALTH_METRICS:
+            cells = np.array([m == metric for m in HEALTH_METRICS])
+        else:
+            raise ValueError(f"Unknown health metric: {metric}")
+
+        rebaselined = self._rebaseline(row, cells)
+        return [m for m, done in zip(HEALTH_METRICS, rebaselined) if done]
+
+    def get_user_alerts(self, user_id):
+        """Return the retained alerts of one user, oldest first"""
+        self._row(user_id)
+        return list(self.alerts.get(user_id, []))
+
+    def get_alerts(self, metric=None):
+        """Return retained alerts across all users, optionally for one metric"""
+        return [
+            alert
+            for user_alerts in self.alerts.values()
+            for alert in user_alerts
+            if metric is None or alert['metric'] == metric
+        ]
+
+    def get_user_stats(self, user_id):
+        """Return the current running statistics of one user"""
+        row = self._row(user_id)
+        count = self.count[row]
+        sigma = self._noise_scale(row)
+        last_week = self.last_week[row]
+
+        return {
+            'last_week': None if np.isnat(last_week) else str(last_week),
+            'metrics': {
+                metric: {
+                    'weeks': int(count[i]),
+                    'baseline': self.baseline[row, i] if count[i] else None,
+                    'noise_std': sigma[i] if count[i] else None,
+                    'ewma': self.fast[row, i]
+                }
+                for i, metric in enumerate(HEALTH_METRICS)
+            }
+        }
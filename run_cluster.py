@@ -0,0 +1,39 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+def spawn(module: str, host: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", host, "--port", str(port)],
+        env={**os.environ, **env}
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run sharded analytics workers behind a router on one machine")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8000, help="Router port; workers use the following ports")
+    args = parser.parse_args()
+
+    worker_urls = []
+    processes = []
+    for shard in range(args.shards):
+        port = args.port + 1 + shard
+        worker_urls.append(f"http://127.0.0.1:{port}")
+        processes.append(spawn("src.lib.api:app", "127.0.0.1", port, {
+            "ANALYTICS_SHARD_INDEX": str(shard),
+            "ANALYTICS_NUM_SHARDS": str(args.shards)
+        }))
+    processes.append(spawn("src.lib.router:app", "0.0.0.0", args.port, {"ANALYTICS_WORKERS": ",".join(worker_urls)}))
+
+    try:
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.wait()
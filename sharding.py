@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+User Sharding
+Stable assignment of users to shards, shared by the shard workers and the router
+"""
+
+import zlib
+
+
+def shard_for_user(user_id, num_shards):
+    """Stable hash partitioning of users across shards"""
+    return zlib.crc32(str(user_id).encode()) % num_shards
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
 import json
+import os
 from user_analytics import UserAnalytics
+from health_monitor import HEALTH_METRICS, InvalidRecordError, StaleRecordError
+from aggregates import finalize_cohort_stats, finalize_provider_rollup
 import plotly.io as pio
 import numpy as np
 import math
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 app = FastAPI()
 
@@ -18,8 +21,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize analytics
-analytics = UserAnalytics()
+# Initialize analytics; ANALYTICS_NUM_SHARDS/ANALYTICS_SHARD_INDEX run this process as one shard worker
+num_shards = os.environ.get("ANALYTICS_NUM_SHARDS")
+if num_shards:
+    analytics = UserAnalytics(
+        shard_index=int(os.environ.get("ANALYTICS_SHARD_INDEX", "0")),
+        num_shards=int(num_shards)
+    )
+else:
+    analytics = UserAnalytics()
 
 def to_native(obj: Any) -> Any:
     if isinstance(obj, dict):
@@ -54,27 +64,45 @@ def handle_error(e: Exception, status_code: int = 500) -> HTTPException:
     print(f"[ERROR] {error_detail}")
     return HTTPException(status_code=status_code, detail=error_detail)
 
+def build_dashboard(user_id: str, peer_density: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Get user profile
+    profile = analytics.get_user_profile(user_id)
+    profile = to_native(profile)  # convert to native types
+    
+    # Create dashboard figure
+    fig = analytics.create_user_dashboard(user_id, peer_density=peer_density)
+    
+    # Convert figure to JSON
+    fig_json = json.loads(pio.to_json(fig))
+    
+    return {
+        "profile": profile,
+        "dashboard": fig_json
+    }
+
 @app.get("/api/user/{user_id}/dashboard")
 async def get_user_dashboard(user_id: str) -> Dict[str, Any]:
     print(f"[DEBUG] /api/user/{user_id}/dashboard endpoint called")
     try:
-        # Get user profile
-        profile = analytics.get_user_profile(user_id)
-        profile = to_native(profile)  # convert to native types
-        
-        # Create dashboard figure
-        fig = analytics.create_user_dashboard(user_id)
-        
-        # Convert figure to JSON
-        fig_json = json.loads(pio.to_json(fig))
-        
-        return {
-            "profile": profile,
-            "dashboard": fig_json
-        }
+        return build_dashboard(user_id)
+    except Exception as e:
+        raise handle_error(e)
+
+# Sharded mode: the router posts peer density grids merged across all shards
+@app.post("/api/user/{user_id}/dashboard")
+async def post_user_dashboard(user_id: str, peers: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    try:
+        return build_dashboard(user_id, peer_density=peers["peer_density"])
     except Exception as e:
         raise handle_error(e)
 
+@app.get("/api/user/{user_id}/profile")
+async def get_user_profile(user_id: str) -> Dict[str, Any]:
+    try:
+        return to_native(analytics.get_user_profile(user_id))
+    except Exception as e:
+        raise handle_error(e, status_code=404)
+
 @app.get("/api/user/{user_id}/progress")
 async def get_user_progress(user_id: str) -> Dict[str, Any]:
     try:
@@ -84,9 +112,199 @@ async def get_user_progress(user_id: str) -> Dict[str, Any]:
         raise handle_error(e, status_code=404)
 
 @app.get("/api/user/{user_id}/similar")
-async def get_similar_users(user_id: str) -> Dict[str, Any]:
+async def get_similar_users(user_id: str, top_n: int = 5) -> Dict[str, Any]:
+    if top_n < 1:
+        raise handle_error(ValueError("top_n must be at least 1"), status_code=400)
+    try:
+        similar = analytics.similar_users_summary(user_id, top_n)
+        return to_native(similar)
+    except Exception as e:
+        raise handle_error(e, status_code=404)
+
+# Sharded mode: the router posts similar-user candidates merged across all shards
+@app.post("/api/user/{user_id}/similar")
+async def post_similar_users(user_id: str, candidates: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     try:
-        similar = analytics.compare_with_similar_users(user_id)
+        similar = analytics.similar_users_summary(user_id, similar_users=candidates["similar_users"])
         return to_native(similar)
     except Exception as e:
-        raise handle_error(e, status_code=404) 
\ No newline at end of file
+        raise handle_error(e, status_code=404)
+
+def parse_list_param(value: Optional[str]) -> list:
+    """Split a comma-joined query parameter (workout types, user IDs)"""
+    if not value:
+        return []
+    return [w.strip() for w in value.split(',') if w.strip()]
+
+@app.get("/api/workouts/users")
+async def get_users_by_workout(all_of: Optional[str] = None, any_of: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        result = analytics.find_users_by_workout(
+            all_of=parse_list_param(all_of),
+            any_of=parse_list_param(any_of)
+        )
+        return to_native(result)
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/workouts/cooccurrence")
+async def get_workout_cooccurrence() -> Dict[str, Any]:
+    try:
+        return to_native(analytics.workout_cooccurrence())
+    except Exception as e:
+        raise handle_error(e)
+
+@app.post("/api/user/{user_id}/activity")
+async def ingest_weekly_activity(user_id: str, record: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    try:
+        alerts = analytics.ingest_weekly_record(user_id, record)
+        return to_native({"alerts": alerts})
+    except InvalidRecordError as e:
+        raise handle_error(e, status_code=422)
+    except StaleRecordError as e:
+        raise handle_error(e, status_code=409)
+    except ValueError as e:
+        raise handle_error(e, status_code=404)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/user/{user_id}/alerts")
+async def get_user_alerts(user_id: str) -> Dict[str, Any]:
+    try:
+        return to_native({
+            "alerts": analytics.health_monitor.get_user_alerts(user_id),
+            "stats": analytics.health_monitor.get_user_stats(user_id)
+        })
+    except Exception as e:
+        raise handle_error(e, status_code=404)
+
+@app.post("/api/user/{user_id}/alerts/acknowledge")
+async def acknowledge_user_alerts(user_id: str, metric: Optional[str] = None) -> Dict[str, Any]:
+    if metric is not None and metric not in HEALTH_METRICS:
+        raise handle_error(ValueError(f"Unknown health metric: {metric}"), status_code=400)
+    try:
+        return to_native({
+            "rebaselined": analytics.health_monitor.acknowledge(user_id, metric),
+            "stats": analytics.health_monitor.get_user_stats(user_id)
+        })
+    except Exception as e:
+        raise handle_error(e, status_code=404)
+
+@app.get("/api/alerts")
+async def get_alerts(metric: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        return to_native({"alerts": analytics.health_monitor.get_alerts(metric)})
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/user/{user_id}/forecast")
+async def get_user_forecast(user_id: str, weeks: int = 12) -> Dict[str, Any]:
+    try:
+        analytics.check_forecast_weeks(weeks)
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    try:
+        return to_native(analytics.get_user_forecast(user_id, weeks))
+    except Exception as e:
+        raise handle_error(e, status_code=404)
+
+@app.get("/api/forecasts")
+async def get_all_forecasts(weeks: int = 12, user_ids: Optional[str] = None,
+                            offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    try:
+        return to_native(analytics.get_all_forecasts(
+            weeks, user_ids=parse_list_param(user_ids) if user_ids is not None else None,
+            offset=offset, limit=limit
+        ))
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/cohorts")
+async def get_cohort_partials() -> Dict[str, Any]:
+    try:
+        return to_native(analytics.cohort_partials())
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/leaderboard")
+async def get_leaderboard_partial(metric: str = "total_steps", top_n: int = 10) -> list:
+    try:
+        return to_native(analytics.leaderboard_partial(metric, top_n))
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/peer-range")
+async def get_peer_range_partials() -> Dict[str, Any]:
+    try:
+        return to_native(analytics.peer_range_partials())
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/peer-density")
+async def get_peer_density_partials() -> Dict[str, Any]:
+    try:
+        return to_native(analytics.peer_density_partials())
+    except Exception as e:
+        raise handle_error(e)
+
+# Sharded mode: grids on the population-wide ranges the router merged from /api/partials/peer-range
+@app.post("/api/partials/peer-density")
+async def post_peer_density_partials(body: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    try:
+        return to_native(analytics.peer_density_partials(body["ranges"]))
+    except KeyError as e:
+        raise handle_error(ValueError(f"Missing peer range: {e}"), status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/similar")
+async def get_similar_candidates(fitness_level: str, age: int, exclude: Optional[str] = None, top_n: int = 5) -> list:
+    try:
+        return to_native(analytics.similar_user_candidates(fitness_level, age, exclude, top_n))
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/user-ids")
+async def get_user_id_partial() -> list:
+    try:
+        return analytics.user_ids_partial()
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/partials/providers")
+async def get_provider_partials() -> Dict[str, Any]:
+    try:
+        return to_native(analytics.provider_partials())
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/cohorts")
+async def get_cohort_stats() -> Dict[str, Any]:
+    try:
+        return to_native(finalize_cohort_stats(analytics.cohort_partials()))
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/leaderboard")
+async def get_leaderboard(metric: str = "total_steps", top_n: int = 10) -> Dict[str, Any]:
+    try:
+        return to_native({"metric": metric, "leaders": analytics.leaderboard_partial(metric, top_n)})
+    except ValueError as e:
+        raise handle_error(e, status_code=400)
+    except Exception as e:
+        raise handle_error(e)
+
+@app.get("/api/providers/rollup")
+async def get_provider_rollup() -> Dict[str, Any]:
+    try:
+        return to_native(finalize_provider_rollup(analytics.provider_partials()))
+    except Exception as e:
+        raise handle_error(e)
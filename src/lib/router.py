@@ -0,0 +1,199 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import heapq
+import os
+import time
+import httpx
+from typing import Dict, Any, Optional
+from sharding import shard_for_user
+from aggregates import (
+    merge_cohort_partials, finalize_cohort_stats, merge_leaderboards,
+    merge_provider_partials, finalize_provider_rollup,
+    merge_workout_results, merge_cooccurrence,
+    merge_peer_ranges, merge_peer_density, merge_similar_candidates
+)
+
+app = FastAPI()
+
+# Enable CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # For development only
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Shard workers in shard order, e.g. "http://127.0.0.1:8001,http://127.0.0.1:8002"
+WORKERS = [url.strip().rstrip("/") for url in os.environ.get("ANALYTICS_WORKERS", "").split(",") if url.strip()]
+
+client = httpx.AsyncClient(timeout=30.0)
+
+# Merged peer density grids change only when workers reload their data
+PEER_DENSITY_TTL_SECONDS = 300
+peer_density_cache: Dict[str, Any] = {"value": None, "fetched_at": 0.0}
+
+# Largest forecast page; matches MAX_FORECAST_PAGE on the workers
+MAX_FORECAST_PAGE = 1000
+
+@app.on_event("shutdown")
+async def close_client() -> None:
+    await client.aclose()
+
+def worker_for(user_id: str) -> str:
+    if not WORKERS:
+        raise HTTPException(status_code=503, detail="No analytics workers configured")
+    return WORKERS[shard_for_user(user_id, len(WORKERS))]
+
+async def call_worker(method: str, url: str, **kwargs) -> Any:
+    """Call a worker and surface its error status unchanged"""
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        print(f"[ERROR] Worker {url} unreachable: {e}")
+        raise HTTPException(status_code=502, detail=f"Worker unreachable: {url}")
+    if response.status_code >= 400:
+        try:
+            body = response.json()
+            detail = body.get("detail", body) if isinstance(body, dict) else body
+        except ValueError:
+            detail = response.text  # e.g. a plain-text 500 from uvicorn
+        raise HTTPException(status_code=response.status_code, detail=detail)
+    return response.json()
+
+async def scatter(path: str, params: Optional[Dict[str, Any]] = None, json: Optional[Any] = None) -> list:
+    """Call the same path on every worker concurrently (POST when a JSON body is given)"""
+    if not WORKERS:
+        raise HTTPException(status_code=503, detail="No analytics workers configured")
+    method = "GET" if json is None else "POST"
+    return await asyncio.gather(*[
+        call_worker(method, f"{worker}{path}", params=params, json=json) for worker in WORKERS
+    ])
+
+def drop_none(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in params.items() if v is not None}
+
+async def merged_peer_density() -> Dict[str, Any]:
+    """Peer density grids summed over all shards, cached for PEER_DENSITY_TTL_SECONDS"""
+    if peer_density_cache["value"] is None or time.monotonic() - peer_density_cache["fetched_at"] > PEER_DENSITY_TTL_SECONDS:
+        # Two rounds: agree on population-wide ranges, then bin every shard on them
+        ranges = merge_peer_ranges(await scatter("/api/partials/peer-range"))
+        merged = merge_peer_density(await scatter("/api/partials/peer-density", json={"ranges": ranges}))
+        peer_density_cache["value"] = {
+            level: dict(density, counts=density["counts"].tolist()) for level, density in merged.items()
+        }
+        peer_density_cache["fetched_at"] = time.monotonic()
+    return peer_density_cache["value"]
+
+# Per-user endpoints that need population-wide peers: gather peers, then let the owning shard render
+@app.get("/api/user/{user_id}/dashboard")
+async def get_user_dashboard(user_id: str) -> Dict[str, Any]:
+    peer_density = await merged_peer_density()
+    return await call_worker(
+        "POST", f"{worker_for(user_id)}/api/user/{user_id}/dashboard",
+        json={"peer_density": peer_density}
+    )
+
+@app.get("/api/user/{user_id}/similar")
+async def get_similar_users(user_id: str, top_n: int = 5) -> Dict[str, Any]:
+    if top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be at least 1")
+    owner = worker_for(user_id)
+    profile = await call_worker("GET", f"{owner}/api/user/{user_id}/profile")
+    partials = await scatter("/api/partials/similar", {
+        "fitness_level": profile["health_metrics"]["fitness_level"],
+        "age": profile["basic_info"]["age"],
+        "exclude": user_id,
+        "top_n": top_n
+    })
+    return await call_worker(
+        "POST", f"{owner}/api/user/{user_id}/similar",
+        json={"similar_users": merge_similar_candidates(partials, top_n)}
+    )
+
+# Other per-user endpoints: forward to the shard owning the user
+@app.api_route("/api/user/{user_id}/{path:path}", methods=["GET", "POST"])
+async def forward_user_request(user_id: str, path: str, request: Request) -> Any:
+    body = await request.body()
+    return await call_worker(
+        request.method,
+        f"{worker_for(user_id)}/api/user/{user_id}/{path}",
+        params=dict(request.query_params),
+        content=body or None,
+        headers={"content-type": request.headers.get("content-type", "application/json")}
+    )
+
+# Population-wide endpoints: scatter-gather partial aggregates
+@app.get("/api/cohorts")
+async def get_cohort_stats() -> Dict[str, Any]:
+    partials = await scatter("/api/partials/cohorts")
+    return finalize_cohort_stats(merge_cohort_partials(partials))
+
+@app.get("/api/leaderboard")
+async def get_leaderboard(metric: str = "total_steps", top_n: int = 10) -> Dict[str, Any]:
+    if top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be at least 1")
+    partials = await scatter("/api/partials/leaderboard", {"metric": metric, "top_n": top_n})
+    return {"metric": metric, "leaders": merge_leaderboards(partials, top_n)}
+
+@app.get("/api/providers/rollup")
+async def get_provider_rollup() -> Dict[str, Any]:
+    partials = await scatter("/api/partials/providers")
+    return finalize_provider_rollup(merge_provider_partials(partials))
+
+@app.get("/api/workouts/users")
+async def get_users_by_workout(all_of: Optional[str] = None, any_of: Optional[str] = None) -> Dict[str, Any]:
+    results = await scatter("/api/workouts/users", drop_none({"all_of": all_of, "any_of": any_of}))
+    return merge_workout_results(results)
+
+@app.get("/api/workouts/cooccurrence")
+async def get_workout_cooccurrence() -> Dict[str, Any]:
+    return merge_cooccurrence(await scatter("/api/workouts/cooccurrence"))
+
+@app.get("/api/alerts")
+async def get_alerts(metric: Optional[str] = None) -> Dict[str, Any]:
+    results = await scatter("/api/alerts", drop_none({"metric": metric}))
+    return {"alerts": [alert for result in results for alert in result["alerts"]]}
+
+@app.get("/api/forecasts")
+async def get_all_forecasts(weeks: int = 12, user_ids: Optional[str] = None,
+                            offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    if not 1 <= limit <= MAX_FORECAST_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_FORECAST_PAGE}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+
+    # 1. Pick the user IDs to fetch: all requested ones, or this page of every shard's sorted IDs
+    if user_ids is not None:
+        wanted = sorted({u.strip() for u in user_ids.split(",") if u.strip()})
+        if len(wanted) > MAX_FORECAST_PAGE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_FORECAST_PAGE} user_ids per request")
+    else:
+        shard_ids = await scatter("/api/partials/user-ids")
+        wanted = list(heapq.merge(*shard_ids))[offset:offset + limit]
+
+    # 2. Ask each owning shard for its users only
+    by_worker: Dict[str, list] = {}
+    for user_id in wanted:
+        by_worker.setdefault(worker_for(user_id), []).append(user_id)
+    results = await asyncio.gather(*[
+        call_worker("GET", f"{worker}/api/forecasts",
+                    params={"weeks": weeks, "user_ids": ",".join(ids), "limit": MAX_FORECAST_PAGE})
+        for worker, ids in by_worker.items()
+    ])
+    forecasts = {user_id: forecast for result in results for user_id, forecast in result["forecasts"].items()}
+
+    # 3. Page in user_id order, like a single worker does
+    if user_ids is not None:
+        found = [user_id for user_id in wanted if user_id in forecasts]
+        page, total = found[offset:offset + limit], len(found)
+    else:
+        page, total = wanted, sum(len(ids) for ids in shard_ids)
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "forecasts": {user_id: forecasts[user_id] for user_id in page},
+        "not_found": sorted(user_id for result in results for user_id in result["not_found"])
+    }
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from user_analytics import MAX_FORECAST_PAGE, MAX_PROJECTION_WEEKS, PROJECTION_WEEKS, UserAnalytics
+
+
+@pytest.fixture(scope='module')
+def analytics(data_dir):
+    return UserAnalytics()
+
+
+def test_projections_use_compact_dtypes_and_default_horizon(analytics):
+    for metric, values in analytics.projections.items():
+        assert values.shape == (len(analytics.master_df), PROJECTION_WEEKS)
+        assert values.dtype == (np.float32 if metric == 'health_score' else np.int32)
+
+
+def test_longer_horizons_extend_the_cached_forecast(analytics):
+    user_id = analytics.master_df['user_id'].iloc[0]
+    short = analytics.get_user_forecast(user_id, PROJECTION_WEEKS)
+    long = analytics.get_user_forecast(user_id, MAX_PROJECTION_WEEKS)
+
+    for metric, values in short.items():
+        assert len(long[metric]) == MAX_PROJECTION_WEEKS
+        np.testing.assert_array_equal(long[metric][:PROJECTION_WEEKS], values)
+
+
+def test_forecast_pages_cover_every_user_once(analytics):
+    seen = []
+    offset = 0
+    while True:
+        page = analytics.get_all_forecasts(4, offset=offset, limit=7)
+        assert page['total'] == len(analytics.master_df)
+        if not page['forecasts']:
+            break
+        seen.extend(page['forecasts'])
+        offset += 7
+
+    assert seen == sorted(analytics.master_df['user_id'])
+
+
+def test_forecasts_for_selected_users(analytics):
+    page = analytics.get_all_forecasts(user_ids=['USR002', 'USR999', 'USR001'])
+
+    assert list(page['forecasts']) == ['USR001', 'USR002']
+    assert page['not_found'] == ['USR999']
+    np.testing.assert_array_equal(
+        page['forecasts']['USR001']['total_steps'], analytics.get_user_forecast('USR001')['total_steps']
+    )
+
+
+@pytest.mark.parametrize('kwargs', [{'limit': 0}, {'limit': MAX_FORECAST_PAGE + 1}, {'offset': -1}, {'num_weeks': 53}])
+def test_invalid_forecast_pages_are_rejected(analytics, kwargs):
+    with pytest.raises(ValueError):
+        analytics.get_all_forecasts(**kwargs)
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import pytest
+
+from health_monitor import HealthMonitor, InvalidRecordError, StaleRecordError
+
+
+def week(w):
+    return str(date(2024, 1, 1) + timedelta(weeks=w))
+
+
+def feed(monitor, metric, values, user_id='USR001'):
+    alerts = []
+    for w, value in enumerate(values):
+        alerts.extend(monitor.update(user_id, {'week_start_date': week(w), metric: value}))
+    return alerts
+
+
+@pytest.mark.parametrize('slope', [2, 1, 0.5])
+def test_linear_resting_hr_drift_alerts(slope):
+    monitor = HealthMonitor(['USR001'])
+    alerts = feed(monitor, 'resting_heart_rate', [60 + slope * w for w in range(30)])
+
+    assert alerts
+    assert all(a['metric'] == 'resting_heart_rate' for a in alerts)
+    # A drift that keeps going keeps re-alerting after each re-baseline
+    assert any(a['week_start_date'] < week(16) for a in alerts)
+    assert any(a['week_start_date'] >= week(24) for a in alerts)
+
+
+def test_permanent_level_shift_is_absorbed():
+    monitor = HealthMonitor(['USR001'], rebaseline_weeks=4)
+    alerts = feed(monitor, 'resting_heart_rate', [60] * 10 + [66] * 20)
+
+    assert [a['week_start_date'] for a in alerts] == [week(w) for w in range(10, 14)]
+    assert monitor.get_user_stats('USR001')['metrics']['resting_heart_rate']['baseline'] == 66
+
+
+def test_acknowledge_rebaselines_at_latest_value():
+    monitor = HealthMonitor(['USR001'])
+    feed(monitor, 'resting_heart_rate', [60] * 10 + [66])
+
+    assert monitor.acknowledge('USR001', 'resting_heart_rate') == ['resting_heart_rate']
+    assert monitor.update('USR001', {'week_start_date': week(11), 'resting_heart_rate': 66}) == []
+    with pytest.raises(ValueError):
+        monitor.acknowledge('USR001', 'steps')
+    with pytest.raises(ValueError):
+        monitor.acknowledge('USR999')
+
+
+def test_sleep_collapse_alerts():
+    monitor = HealthMonitor(['USR001'])
+    alerts = feed(monitor, 'sleep_hours_total', [56 - w for w in range(30)])
+
+    assert alerts
+    assert alerts[0]['week_start_date'] <= week(8)
+
+
+def test_rising_sleep_does_not_alert():
+    monitor = HealthMonitor(['USR001'])
+    assert feed(monitor, 'sleep_hours_total', [40 + w for w in range(20)]) == []
+
+
+def test_single_spike_does_not_hide_later_anomalies():
+    monitor = HealthMonitor(['USR001'])
+    alerts = feed(monitor, 'resting_heart_rate', [60] * 8 + [75] + [60] * 5 + [75])
+
+    assert [(a['week_start_date'], a['kind']) for a in alerts] == [(week(8), 'spike'), (week(14), 'spike')]
+
+
+def test_invalid_and_stale_records_are_rejected():
+    monitor = HealthMonitor(['USR001'])
+    monitor.update('USR001', {'week_start_date': week(0), 'avg_heart_rate': 70})
+
+    with pytest.raises(InvalidRecordError):
+        monitor.update('USR001', {'week_start_date': week(1), 'avg_heart_rate': 'abc'})
+    with pytest.raises(InvalidRecordError):
+        monitor.update('USR001', {'avg_heart_rate': 70})
+    with pytest.raises(StaleRecordError):
+        monitor.update('USR001', {'week_start_date': week(0), 'avg_heart_rate': 70})
+    with pytest.raises(ValueError):
+        monitor.update('USR999', {'week_start_date': week(1), 'avg_heart_rate': 70})
+
+    assert monitor.get_user_stats('USR001')['metrics']['avg_heart_rate']['weeks'] == 1
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from user_analytics import PEER_DENSITY_BINS, UserAnalytics
+
+
+@pytest.fixture(scope='module')
+def analytics(data_dir):
+    return UserAnalytics()
+
+
+def peer_trace(analytics, user_id):
+    fig = analytics.create_user_dashboard(user_id)
+    return next(trace for trace in fig.data if trace.name == 'Peers')
+
+
+@pytest.mark.parametrize('fitness_level', ['Beginner', 'Intermediate', 'Advanced'])
+def test_peer_trace_is_bounded_and_counts_the_whole_cohort(analytics, fitness_level):
+    cohort = analytics.master_df[analytics.master_df['fitness_level'] == fitness_level]
+    trace = peer_trace(analytics, cohort['user_id'].iloc[0])
+
+    assert len(trace.x) == len(trace.y) == len(trace.customdata) <= PEER_DENSITY_BINS ** 2
+    assert int(np.sum(trace.customdata)) == len(cohort)
+
+
+@pytest.mark.parametrize('fitness_level', ['Beginner', 'Intermediate', 'Advanced'])
+def test_grid_spans_the_cohort_range(analytics, fitness_level):
+    cohort = analytics.master_df[analytics.master_df['fitness_level'] == fitness_level]
+    density = analytics.peer_density[fitness_level]
+
+    assert density['steps_range'] == [cohort['total_steps'].min(), cohort['total_steps'].max()]
+    assert density['calories_range'] == [cohort['total_calories_burned'].min(), cohort['total_calories_burned'].max()]
+    assert density['counts'].shape == (PEER_DENSITY_BINS, PEER_DENSITY_BINS)
+
+
+def test_out_of_range_values_count_in_edge_cells(analytics):
+    narrow = {
+        level: {'steps': [lo + (hi - lo) * 0.4, lo + (hi - lo) * 0.6], 'calories': ranges['calories']}
+        for level, ranges in analytics.peer_range_partials().items()
+        for lo, hi in [ranges['steps']]
+    }
+    for fitness_level, density in analytics.compute_peer_density(narrow).items():
+        cohort_size = int((analytics.master_df['fitness_level'] == fitness_level).sum())
+        assert density['counts'].sum() == cohort_size
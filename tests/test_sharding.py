@@ -0,0 +1,126 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from aggregates import (
+    finalize_cohort_stats, finalize_provider_rollup, merge_cohort_partials,
+    merge_leaderboards, merge_moments, merge_peer_density, merge_peer_ranges,
+    merge_provider_partials, merge_similar_candidates
+)
+from user_analytics import UserAnalytics
+
+NUM_SHARDS = 3
+
+
+@pytest.fixture(scope='module')
+def single(data_dir):
+    return UserAnalytics()
+
+
+@pytest.fixture(scope='module')
+def shards(data_dir):
+    return [UserAnalytics(shard_index=i, num_shards=NUM_SHARDS) for i in range(NUM_SHARDS)]
+
+
+def test_shards_partition_users(single, shards):
+    shard_users = [set(shard.master_df['user_id']) for shard in shards]
+    assert sum(len(users) for users in shard_users) == len(single.master_df)
+    assert set().union(*shard_users) == set(single.master_df['user_id'])
+
+
+def test_merged_cohort_stats_match_single_process(single, shards):
+    expected = finalize_cohort_stats(single.cohort_partials())
+    merged = finalize_cohort_stats(merge_cohort_partials([shard.cohort_partials() for shard in shards]))
+
+    assert merged.keys() == expected.keys()
+    for cohort, metrics in expected.items():
+        assert merged[cohort].keys() == metrics.keys()
+        for metric, stats in metrics.items():
+            got = merged[cohort][metric]
+            assert (got['count'], got['min'], got['max']) == (stats['count'], stats['min'], stats['max'])
+            assert got['mean'] == pytest.approx(stats['mean'], rel=1e-12)
+            assert got['std'] == pytest.approx(stats['std'], rel=1e-12)
+
+
+@pytest.mark.parametrize('metric', ['total_steps', 'health_score', 'resting_heart_rate'])
+@pytest.mark.parametrize('top_n', [1, 5, 50])
+def test_merged_leaderboard_matches_single_process(single, shards, metric, top_n):
+    expected = single.leaderboard_partial(metric, top_n)
+    merged = merge_leaderboards([shard.leaderboard_partial(metric, top_n) for shard in shards], top_n)
+
+    assert merged == expected
+
+
+def test_merged_provider_rollup_matches_single_process(single, shards):
+    expected = finalize_provider_rollup(single.provider_partials())
+    merged = finalize_provider_rollup(merge_provider_partials([shard.provider_partials() for shard in shards]))
+
+    assert merged == expected
+
+
+def test_merged_peer_density_matches_single_process(single, shards):
+    ranges = merge_peer_ranges([shard.peer_range_partials() for shard in shards])
+    merged = merge_peer_density([shard.peer_density_partials(ranges) for shard in shards])
+
+    assert merged.keys() == single.peer_density.keys()
+    for fitness_level, density in single.peer_density.items():
+        assert merged[fitness_level]['steps_range'] == density['steps_range']
+        assert merged[fitness_level]['calories_range'] == density['calories_range']
+        np.testing.assert_array_equal(merged[fitness_level]['counts'], density['counts'])
+
+
+def test_merged_similar_candidates_match_single_process(single, shards):
+    for user_id in single.master_df['user_id']:
+        user = single.master_df[single.master_df['user_id'] == user_id].iloc[0]
+        args = (user['fitness_level'], user['age'], user_id, 5)
+        merged = merge_similar_candidates([shard.similar_user_candidates(*args) for shard in shards], 5)
+
+        assert merged == single.similar_user_candidates(*args)
+
+
+def test_similar_users_summary_with_merged_candidates_does_not_plot(single, shards):
+    user = single.master_df.iloc[0]
+    args = (user['fitness_level'], user['age'], user['user_id'], 5)
+    merged = merge_similar_candidates([shard.similar_user_candidates(*args) for shard in shards], 5)
+    open_figures = len(plt.get_fignums())
+
+    assert single.similar_users_summary(user['user_id'], similar_users=merged) == single.similar_users_summary(user['user_id'])
+    assert len(plt.get_fignums()) == open_figures
+
+
+def test_merge_moments_keeps_precision_for_large_means():
+    values = 1e8 + np.random.default_rng(0).standard_normal(10000)
+    chunks = np.array_split(values, 7)
+    partials = [
+        {'c': {'x': {'count': len(c), 'mean': c.mean(), 'm2': ((c - c.mean()) ** 2).sum(),
+                     'min': c.min(), 'max': c.max()}}}
+        for c in chunks
+    ]
+    stats = finalize_cohort_stats(merge_cohort_partials(partials))['c']['x']
+
+    assert stats['std'] == pytest.approx(values.std(ddof=1), rel=1e-9)
+    assert merge_moments(partials[0]['c']['x'], partials[1]['c']['x'])['count'] == len(chunks[0]) + len(chunks[1])
+
+
+def test_leaderboard_rejects_non_positive_top_n(single):
+    with pytest.raises(ValueError):
+        single.leaderboard_partial('total_steps', 0)
+    with pytest.raises(ValueError):
+        merge_leaderboards([[]], -1)
+
+
+def test_forecasts_are_identical_across_instances_and_shards(single, shards):
+    other = UserAnalytics()
+    for user_id in single.master_df['user_id']:
+        expected = single.get_user_forecast(user_id, 52)
+        owner = next(shard for shard in shards if user_id in shard._user_positions)
+        for got in (other.get_user_forecast(user_id, 52), owner.get_user_forecast(user_id, 52)):
+            for metric, values in expected.items():
+                np.testing.assert_array_equal(got[metric], values)
+
+
+def test_similar_candidates_reject_non_positive_top_n(single):
+    with pytest.raises(ValueError):
+        single.similar_user_candidates('Beginner', 30, top_n=0)
+    with pytest.raises(ValueError):
+        merge_similar_candidates([[]], -1)
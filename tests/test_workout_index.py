@@ -0,0 +1,74 @@
+import itertools
+
+import pytest
+
+from user_analytics import UserAnalytics, WORKOUT_AGGREGATE_METRICS
+
+
+@pytest.fixture(scope='module')
+def analytics(data_dir):
+    return UserAnalytics()
+
+
+@pytest.fixture(scope='module')
+def scanned(analytics):
+    """Reference: workout types per user from a plain str.split(',') scan"""
+    df = analytics.master_df
+    return [
+        (user_id, {w.strip() for w in workout_types.split(',') if w.strip()})
+        for user_id, workout_types in zip(df['user_id'], df['workout_types'])
+    ]
+
+
+def expected_totals(analytics, user_ids):
+    rows = analytics.master_df[analytics.master_df['user_id'].isin(user_ids)]
+    return {metric: pytest.approx(float(rows[metric].sum())) for metric in WORKOUT_AGGREGATE_METRICS}
+
+
+ALL_OF = [[], ['Running'], ['Cycling', 'Running'], ['Gym', 'Walking'], ['Yoga', 'Swimming', 'Running']]
+ANY_OF = [[], ['Gym'], ['Yoga', 'Gym'], ['Dance', 'Cycling', 'Swimming']]
+
+
+@pytest.mark.parametrize('all_of,any_of', [(a, o) for a in ALL_OF for o in ANY_OF if a or o])
+def test_queries_match_split_scan(analytics, scanned, all_of, any_of):
+    expected = [
+        user_id for user_id, types in scanned
+        if set(all_of) <= types and (not any_of or types & set(any_of))
+    ]
+    result = analytics.find_users_by_workout(all_of=all_of, any_of=any_of)
+
+    assert result['user_ids'] == expected
+    assert result['user_count'] == len(expected)
+    assert result['totals'] == expected_totals(analytics, expected)
+
+
+def test_empty_query_is_rejected(analytics):
+    with pytest.raises(ValueError):
+        analytics.find_users_by_workout(all_of=[' '], any_of=[])
+
+
+def test_every_type_matches_split_scan(analytics, scanned):
+    # Exercises the bitset probe at every bit offset the data produces
+    for workout_type in analytics.workout_type_names.values():
+        for other in ['Running', 'Walking']:
+            expected = [u for u, types in scanned if {workout_type, other} <= types]
+            assert analytics.find_users_by_workout(all_of=[workout_type, other])['user_ids'] == expected
+
+
+def test_query_terms_are_normalized_and_echoed_in_request_order(analytics):
+    result = analytics.find_users_by_workout(all_of=['running', ' CYCLING '], any_of=['gym', 'Gym'])
+    reference = analytics.find_users_by_workout(all_of=['Running', 'Cycling'], any_of=['Gym'])
+
+    assert result['user_ids'] == reference['user_ids']
+    assert result['all_of'] == ['running', 'CYCLING']
+    assert result['any_of'] == ['gym']
+
+
+def test_cooccurrence_matches_split_scan(analytics, scanned):
+    counts = analytics.workout_cooccurrence()
+    all_types = set().union(*(types for _, types in scanned))
+
+    assert set(counts) == all_types
+    for first, second in itertools.combinations_with_replacement(sorted(all_types), 2):
+        expected = sum(1 for _, types in scanned if first in types and second in types)
+        assert counts[first][second] == counts[second][first] == expected
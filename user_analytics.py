@@ -12,14 +12,61 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
+import zlib
+from health_monitor import HealthMonitor, HEALTH_METRICS
+from sharding import shard_for_user
 import warnings
 warnings.filterwarnings('ignore')
 
+# Activity columns summed over the users matched by a workout-type query
+WORKOUT_AGGREGATE_METRICS = [
+    'cycling_distance_km', 'running_distance_km', 'walking_distance_km',
+    'total_distance_km', 'total_active_minutes', 'exercise_sessions'
+]
+
+# Grid resolution of the peer density; caps the "Activity vs Peers" panel at BINS x BINS points.
+# Each fitness level's grid spans that level's population-wide min/max, so per-shard counts can be summed.
+PEER_DENSITY_BINS = 20
+
+# Metrics compared against similar users
+SIMILAR_METRICS = ['total_steps', 'total_calories_burned', 'total_active_minutes', 'health_score']
+
+# Default (precomputed) and maximum forecast horizon and base seed; every user draws from
+# its own seeded generator. Longer horizons are projected on demand, above MAX are rejected.
+PROJECTION_WEEKS = 12
+MAX_PROJECTION_WEEKS = 52
+PROJECTION_SEED = 42
+
+# Most users returned by one page of get_all_forecasts
+MAX_FORECAST_PAGE = 1000
+
+# Numeric columns summarized per fitness level and rankable on the leaderboard
+COHORT_METRICS = [
+    'age', 'bmi', 'total_steps', 'total_calories_burned', 'total_active_minutes',
+    'exercise_sessions', 'sleep_hours_total', 'resting_heart_rate', 'health_score'
+]
+
+def peer_bin_edges(value_range):
+    """PEER_DENSITY_BINS equal-width bins over [min, max] (widened when min == max)"""
+    low, high = value_range
+    if high <= low:
+        high = low + 1
+    return np.linspace(low, high, PEER_DENSITY_BINS + 1)
+
+def normalize_workout_type(workout_type):
+    """Case- and whitespace-insensitive key for a workout type"""
+    return ' '.join(str(workout_type).split()).lower()
+
 class UserAnalytics:
-    def __init__(self):
-        """Initialize with dataset loading"""
+    def __init__(self, shard_index=None, num_shards=None):
+        """Initialize with dataset loading, optionally restricted to one shard of users"""
+        if num_shards is not None and not 0 <= shard_index < num_shards:
+            raise ValueError(f"Shard index {shard_index} out of range for {num_shards} shards")
+        self.shard_index = shard_index
+        self.num_shards = num_shards
         self.load_datasets()
         self.prepare_master_dataset()
+        self.init_health_monitor()
     
     def load_datasets(self):
         """Load all CSV datasets"""
@@ -29,11 +76,23 @@ class UserAnalytics:
             self.activity_df = pd.read_csv('users_activity_weekly.csv')
             self.insurance_df = pd.read_csv('insurance_providers.csv')
             self.services_df = pd.read_csv('insurance_services.csv')
+            
+            # In sharded mode keep only the users hashed to this shard
+            if self.num_shards is not None:
+                self.demo_df = self._select_shard(self.demo_df)
+                self.physical_df = self._select_shard(self.physical_df)
+                self.activity_df = self._select_shard(self.activity_df)
+                print(f"✅ Shard {self.shard_index}/{self.num_shards}: {self.demo_df['user_id'].nunique()} users")
             print("✅ All datasets loaded successfully")
         except FileNotFoundError as e:
             print(f"❌ Error loading datasets: {e}")
             raise
     
+    def _select_shard(self, df):
+        """Keep rows whose user_id hashes to this shard"""
+        shards = df['user_id'].map(lambda user_id: shard_for_user(user_id, self.num_shards))
+        return df[shards == self.shard_index].reset_index(drop=True)
+    
     def prepare_master_dataset(self):
         """Combine all datasets and clean for analysis"""
         # Merge user data
@@ -61,8 +120,27 @@ class UserAnalytics:
         self.master_df['activity_efficiency'] = self.master_df['total_calories_burned'] / self.master_df['total_active_minutes']
         self.master_df['health_score'] = self._calculate_health_score()
         
+        # Parse multi-valued workout types once into an inverted index
+        self._build_workout_index()
+        
+        # Precompute peer distributions once instead of plotting every peer per request
+        self._build_peer_density()
+        
+        # Deterministic multi-week forecasts for every user at once
+        self._build_projections()
+        
         print(f"✅ Master dataset prepared: {len(self.master_df)} users, {len(self.master_df.columns)} features")
     
+    def init_health_monitor(self):
+        """Seed the streaming health monitor with the weekly records loaded so far"""
+        self.health_monitor = HealthMonitor(self.master_df['user_id'])
+        history = self.master_df[['user_id', 'week_start_date'] + HEALTH_METRICS]
+        self.health_monitor.update_many(history.sort_values('week_start_date'))
+    
+    def ingest_weekly_record(self, user_id, record):
+        """Feed a new weekly record to the health monitor and return any new alerts"""
+        return self.health_monitor.update(user_id, record)
+    
     def _calculate_health_score(self):
         """Calculate a composite health score (0-100)"""
         scores = []
@@ -105,6 +183,313 @@ class UserAnalytics:
         
         return scores
     
+    def _build_workout_index(self):
+        """Build inverted index (workout type -> sorted user positions) with packed bitsets"""
+        num_users = len(self.master_df)
+        postings = {}
+        self.workout_type_names = {}  # normalized key -> name as first seen in the data, for responses
+        for position, workout_types in enumerate(self.master_df['workout_types'].fillna('')):
+            for name in workout_types.split(','):
+                key = normalize_workout_type(name)
+                if not key:
+                    continue
+                self.workout_type_names.setdefault(key, ' '.join(name.split()))
+                positions = postings.setdefault(key, [])
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        
+        # Positions are appended in row order, so every posting list is already sorted
+        self.workout_index = {
+            workout_type: np.asarray(positions, dtype=np.int32)
+            for workout_type, positions in postings.items()
+        }
+        self.workout_bitsets = {}
+        for workout_type, positions in self.workout_index.items():
+            bits = np.zeros(num_users, dtype=bool)
+            bits[positions] = True
+            self.workout_bitsets[workout_type] = np.packbits(bits)
+        
+        # Column-oriented copies so aggregates only touch the matched rows
+        self._user_ids = self.master_df['user_id'].to_numpy()
+        self._workout_metrics = {
+            metric: self.master_df[metric].to_numpy(dtype=float)
+            for metric in WORKOUT_AGGREGATE_METRICS
+        }
+    
+    def _has_workout_type(self, workout_type, positions):
+        """Test bitset membership for an array of user positions"""
+        bitset = self.workout_bitsets.get(workout_type)
+        if bitset is None:
+            return np.zeros(len(positions), dtype=bool)
+        return ((bitset[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+    
+    def _dedupe_workout_terms(self, terms):
+        """Strip query terms and drop repeats of the same normalized type, keeping order"""
+        deduped = {}
+        for term in terms or []:
+            key = normalize_workout_type(term)
+            if key:
+                deduped.setdefault(key, ' '.join(str(term).split()))
+        return list(deduped.values())
+    
+    def find_users_by_workout(self, all_of=None, any_of=None):
+        """Find users matching ALL of `all_of` and at least one of `any_of` workout types"""
+        # Echo the request terms in request order; match on their normalized keys
+        requested_all = self._dedupe_workout_terms(all_of)
+        requested_any = self._dedupe_workout_terms(any_of)
+        all_of = [normalize_workout_type(w) for w in requested_all]
+        any_of = [normalize_workout_type(w) for w in requested_any]
+        if not all_of and not any_of:
+            raise ValueError("At least one workout type is required")
+        
+        empty = np.empty(0, dtype=np.int32)
+        if all_of:
+            # AND: start from the rarest type and probe the remaining bitsets
+            by_rarity = sorted(all_of, key=lambda w: len(self.workout_index.get(w, empty)))
+            positions = self.workout_index.get(by_rarity[0], empty)
+            for workout_type in by_rarity[1:]:
+                positions = positions[self._has_workout_type(workout_type, positions)]
+            
+            # OR: keep candidates holding at least one of the `any_of` types
+            if any_of:
+                matches = np.zeros(len(positions), dtype=bool)
+                for workout_type in any_of:
+                    matches |= self._has_workout_type(workout_type, positions)
+                positions = positions[matches]
+        else:
+            # OR only: merge the posting lists of the requested types
+            lists = [self.workout_index.get(w, empty) for w in any_of]
+            positions = np.unique(np.concatenate(lists))
+        
+        return {
+            'all_of': requested_all,
+            'any_of': requested_any,
+            'user_count': len(positions),
+            'user_ids': self._user_ids[positions].tolist(),
+            'totals': {
+                metric: float(values[positions].sum())
+                for metric, values in self._workout_metrics.items()
+            }
+        }
+    
+    def workout_cooccurrence(self):
+        """Count users sharing each pair of workout types, keyed by display name"""
+        workout_types = sorted(self.workout_index)
+        names = self.workout_type_names
+        counts = {}
+        for i, first in enumerate(workout_types):
+            first_positions = self.workout_index[first]
+            counts[names[first]] = {names[first]: len(first_positions)}
+            for second in workout_types[:i]:
+                shared = int(self._has_workout_type(second, first_positions).sum())
+                counts[names[first]][names[second]] = shared
+                counts[names[second]][names[first]] = shared
+        
+        return counts
+    
+    def _build_peer_density(self):
+        """Bin steps vs calories into a 2D histogram per fitness level over this dataset's ranges"""
+        self.peer_density = self.compute_peer_density(self.peer_range_partials())
+    
+    def peer_range_partials(self):
+        """Steps/calories min/max per fitness level; merged across shards they fix the grid edges"""
+        return {
+            fitness_level: {
+                'steps': [peers['total_steps'].min(), peers['total_steps'].max()],
+                'calories': [peers['total_calories_burned'].min(), peers['total_calories_burned'].max()]
+            }
+            for fitness_level, peers in self.master_df.groupby('fitness_level')
+        }
+    
+    def compute_peer_density(self, ranges):
+        """Bin steps vs calories per fitness level on grids spanning the given ranges
+
+        Values outside a range (e.g. users added after the ranges were taken) are counted in the edge cells.
+        """
+        density = {}
+        for fitness_level, peers in self.master_df.groupby('fitness_level'):
+            level_range = ranges[fitness_level]
+            steps_edges = peer_bin_edges(level_range['steps'])
+            calories_edges = peer_bin_edges(level_range['calories'])
+            counts, _, _ = np.histogram2d(
+                np.clip(peers['total_steps'], steps_edges[0], steps_edges[-1]),
+                np.clip(peers['total_calories_burned'], calories_edges[0], calories_edges[-1]),
+                bins=[steps_edges, calories_edges]
+            )
+            density[fitness_level] = {
+                'counts': counts.astype(int),
+                'steps_range': list(level_range['steps']),
+                'calories_range': list(level_range['calories'])
+            }
+        
+        return density
+    
+    def _peer_cells(self, density):
+        """Occupied cells of a peer density grid; only these are shipped to the client"""
+        counts = np.asarray(density['counts'], dtype=int)
+        steps_edges = peer_bin_edges(density['steps_range'])
+        calories_edges = peer_bin_edges(density['calories_range'])
+        x_centers = (steps_edges[:-1] + steps_edges[1:]) / 2
+        y_centers = (calories_edges[:-1] + calories_edges[1:]) / 2
+        x_idx, y_idx = np.nonzero(counts)
+        return {
+            'steps': x_centers[x_idx],
+            'calories': y_centers[y_idx],
+            'counts': counts[x_idx, y_idx]
+        }
+    
+    def _user_rng(self, user_id):
+        """Seeded generator for a user, stable across processes and restarts"""
+        return np.random.default_rng([PROJECTION_SEED, zlib.crc32(str(user_id).encode())])
+    
+    def _build_projections(self):
+        """Precompute the default-horizon projections of all users as compact arrays"""
+        self._user_ids = self.master_df['user_id'].to_numpy()
+        self._user_positions = {user_id: i for i, user_id in enumerate(self._user_ids)}
+        self.projections = self._project(np.arange(len(self._user_ids)), PROJECTION_WEEKS)
+    
+    def _project(self, positions, num_weeks):
+        """Project steps, calories, sessions and health score for the users at the given positions"""
+        rows = self.master_df.iloc[positions]
+        
+        # (users, weeks, 2): draws are week-major so week w's values don't depend on the horizon;
+        # column 0 drives activity variation, column 1 health score variation
+        noise = np.array([
+            self._user_rng(user_id).standard_normal((num_weeks, 2)) for user_id in self._user_ids[positions]
+        ]).reshape(len(positions), num_weeks, 2)
+        
+        weeks = np.arange(num_weeks)
+        activity_factor = (1 + weeks * 0.02) * (1 + 0.1 * noise[:, :, 0])  # 2% weekly improvement, 10% variation
+        
+        def project(metric):
+            return rows[metric].to_numpy(dtype=float)[:, None] * activity_factor
+        
+        health_score = rows['health_score'].to_numpy(dtype=float)[:, None]
+        return {
+            'total_steps': project('total_steps').astype(np.int32),
+            'total_calories_burned': project('total_calories_burned').astype(np.int32),
+            'exercise_sessions': np.maximum(1, project('exercise_sessions').astype(np.int32)),
+            'health_score': (health_score - 20 + (weeks + 1) * 2 + 3 * noise[:, :, 1]).astype(np.float32)
+        }
+    
+    def _forecasts(self, positions, num_weeks):
+        """Forecast arrays for the given positions, from the cache when the horizon allows"""
+        if num_weeks <= PROJECTION_WEEKS:
+            return {metric: values[positions, :num_weeks] for metric, values in self.projections.items()}
+        return self._project(positions, num_weeks)
+    
+    def check_forecast_weeks(self, num_weeks):
+        """Reject forecast horizons outside the supported range"""
+        if not 1 <= num_weeks <= MAX_PROJECTION_WEEKS:
+            raise ValueError(f"num_weeks must be between 1 and {MAX_PROJECTION_WEEKS}")
+    
+    def get_user_forecast(self, user_id, num_weeks=PROJECTION_WEEKS):
+        """Return the forecast of one user (at most MAX_PROJECTION_WEEKS weeks)"""
+        self.check_forecast_weeks(num_weeks)
+        if user_id not in self._user_positions:
+            raise ValueError(f"User {user_id} not found")
+        
+        forecasts = self._forecasts([self._user_positions[user_id]], num_weeks)
+        return {metric: values[0] for metric, values in forecasts.items()}
+    
+    def get_all_forecasts(self, num_weeks=PROJECTION_WEEKS, user_ids=None, offset=0, limit=100):
+        """Return one page of forecasts keyed by user_id, in user_id order
+
+        user_ids restricts the page to those users; unknown ones are listed under 'not_found'.
+        """
+        self.check_forecast_weeks(num_weeks)
+        if not 1 <= limit <= MAX_FORECAST_PAGE:
+            raise ValueError(f"limit must be between 1 and {MAX_FORECAST_PAGE}")
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        
+        if user_ids is None:
+            selected, not_found = sorted(self._user_positions), []
+        elif len(set(user_ids)) > MAX_FORECAST_PAGE:
+            raise ValueError(f"At most {MAX_FORECAST_PAGE} user_ids per request")
+        else:
+            selected = sorted(set(user_ids) & self._user_positions.keys())
+            not_found = sorted(set(user_ids) - self._user_positions.keys())
+        page = selected[offset:offset + limit]
+        
+        forecasts = self._forecasts([self._user_positions[user_id] for user_id in page], num_weeks)
+        return {
+            'total': len(selected),
+            'offset': offset,
+            'limit': limit,
+            'forecasts': {
+                user_id: {metric: values[i] for metric, values in forecasts.items()}
+                for i, user_id in enumerate(page)
+            },
+            'not_found': not_found
+        }
+    
+    def user_ids_partial(self):
+        """Sorted user_ids held by this instance; merged across shards they page population-wide lists"""
+        return sorted(self._user_positions)
+    
+    def cohort_partials(self):
+        """Mergeable count/mean/m2/min/max per fitness level and metric"""
+        partials = {}
+        for fitness_level, cohort in self.master_df.groupby('fitness_level'):
+            partials[fitness_level] = {}
+            for metric in COHORT_METRICS:
+                values = cohort[metric].dropna().to_numpy(dtype=float)
+                if len(values) == 0:
+                    continue
+                mean = values.mean()
+                partials[fitness_level][metric] = {
+                    'count': len(values),
+                    'mean': mean,
+                    'm2': ((values - mean) ** 2).sum(),
+                    'min': values.min(),
+                    'max': values.max()
+                }
+        
+        return partials
+    
+    def leaderboard_partial(self, metric='total_steps', top_n=10):
+        """Top users by a metric; the global top_n is contained in the union of shard top_n lists"""
+        if metric not in COHORT_METRICS:
+            raise ValueError(f"Unsupported leaderboard metric: {metric}")
+        if top_n < 1:
+            raise ValueError("top_n must be at least 1")
+        
+        top = self.master_df.dropna(subset=[metric]).sort_values(
+            [metric, 'user_id'], ascending=False
+        ).head(top_n)
+        return [
+            {
+                'user_id': row['user_id'],
+                'name': f"{row['first_name']} {row['last_name']}",
+                'fitness_level': row['fitness_level'],
+                'value': row[metric]
+            }
+            for _, row in top.iterrows()
+        ]
+    
+    def provider_partials(self):
+        """Mergeable per-provider counters"""
+        grouped = self.master_df.groupby('current_insurance_provider')
+        partials = {}
+        for provider, members in grouped:
+            partials[provider] = {
+                'provider_id': members['provider_id'].iloc[0],
+                'users': len(members),
+                'total_steps': members['total_steps'].sum(),
+                'total_calories_burned': members['total_calories_burned'].sum(),
+                'health_score': members['health_score'].sum(),
+                'users_over_10k_steps': int((members['steps_per_day'] >= 10000).sum())
+            }
+        
+        return partials
+    
+    def peer_density_partials(self, ranges=None):
+        """Per-fitness-level peer grids; on shared (merged) ranges they are summable across shards"""
+        if ranges is None:
+            return dict(self.peer_density)
+        return self.compute_peer_density(ranges)
+    
     def get_user_profile(self, user_id):
         """Get comprehensive user profile"""
         print(f"[DEBUG] Searching for user_id: {user_id}")
@@ -147,8 +532,11 @@ class UserAnalytics:
         
         return profile
     
-    def create_user_dashboard(self, user_id, save_path=None):
-        """Create comprehensive user dashboard with enhanced styling"""
+    def create_user_dashboard(self, user_id, save_path=None, peer_density=None):
+        """Create comprehensive user dashboard with enhanced styling
+
+        peer_density overrides the local per-fitness-level grids, e.g. with grids merged across shards.
+        """
         user_profile = self.get_user_profile(user_id)
         user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
         
@@ -225,20 +613,25 @@ class UserAnalytics:
         )
         
         # 3. Activity vs Peers
-        peers = self.master_df[self.master_df['fitness_level'] == user_data['fitness_level']]
+        peer_density = self.peer_density if peer_density is None else peer_density
+        peers = self._peer_cells(peer_density[user_data['fitness_level']])
         
         fig.add_trace(
             go.Scatter(
-                x=peers['total_steps'],
-                y=peers['total_calories_burned'],
+                x=peers['steps'],
+                y=peers['calories'],
                 mode='markers',
                 name='Peers',
+                customdata=peers['counts'],
                 marker=dict(
                     color=colors['secondary'],
-                    size=8,
+                    size=6 + 14 * np.sqrt(peers['counts'] / peers['counts'].max()),
                     opacity=0.6
                 ),
-                hovertemplate="Steps: %{x:,.0f}<br>Calories: %{y:,.0f}<extra></extra>"
+                hovertemplate=(
+                    "Steps: ~%{x:,.0f}<br>Calories: ~%{y:,.0f}<br>Peers: %{customdata}"
+                    "<br><i>Binned; values outside the grid count in the edge cells</i><extra></extra>"
+                )
             ),
             row=2, col=1
         )
@@ -295,8 +688,8 @@ class UserAnalytics:
         )
         
         # 6. Fitness Progress
-        weeks = list(range(1, 13))
-        progress = [user_data['health_score'] - 20 + i*2 + np.random.normal(0, 3) for i in weeks]
+        weeks = list(range(1, PROJECTION_WEEKS + 1))
+        progress = self.get_user_forecast(user_id)['health_score']
         
         fig.add_trace(
             go.Scatter(
@@ -391,11 +784,11 @@ class UserAnalytics:
         
         return fig
     
-    def track_weekly_progress(self, user_id, weeks_data=None):
-        """Track user progress over multiple weeks"""
+    def track_weekly_progress(self, user_id, weeks_data=None, num_weeks=8):
+        """Track user progress over multiple weeks (num_weeks of sample data when weeks_data is None)"""
         if weeks_data is None:
             # Generate sample weekly data for demonstration
-            weeks_data = self._generate_sample_weekly_data(user_id)
+            weeks_data = self._generate_sample_weekly_data(user_id, num_weeks)
         
         user_profile = self.get_user_profile(user_id)
         
@@ -457,45 +850,73 @@ class UserAnalytics:
         return weeks_data
     
     def _generate_sample_weekly_data(self, user_id, num_weeks=8):
-        """Generate sample weekly progression data"""
-        user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
+        """Generate sample weekly progression data (up to MAX_PROJECTION_WEEKS weeks)"""
+        forecast = self.get_user_forecast(user_id, num_weeks)
         
-        weeks_data = []
-        base_steps = user_data['total_steps']
-        base_calories = user_data['total_calories_burned']
-        base_sessions = user_data['exercise_sessions']
-        
-        for week in range(num_weeks):
-            # Add some progression and random variation
-            progression_factor = 1 + (week * 0.02)  # 2% improvement per week
-            noise_factor = np.random.normal(1, 0.1)  # 10% random variation
-            
-            week_data = {
-                'total_steps': int(base_steps * progression_factor * noise_factor),
-                'total_calories_burned': int(base_calories * progression_factor * noise_factor),
-                'exercise_sessions': max(1, int(base_sessions * progression_factor * noise_factor))
+        weeks_data = [
+            {
+                'total_steps': int(forecast['total_steps'][week]),
+                'total_calories_burned': int(forecast['total_calories_burned'][week]),
+                'exercise_sessions': int(forecast['exercise_sessions'][week])
             }
-            weeks_data.append(week_data)
+            for week in range(num_weeks)
+        ]
         
         return weeks_data
     
-    def compare_with_similar_users(self, user_id, top_n=5):
+    def similar_user_candidates(self, fitness_level, age, exclude_user_id=None, top_n=5):
+        """First top_n users (by user_id) with the same fitness level and age within 5 years"""
+        if top_n < 1:
+            raise ValueError("top_n must be at least 1")
+        candidates = self.master_df[
+            (self.master_df['fitness_level'] == fitness_level) &
+            (abs(self.master_df['age'] - age) <= 5) &
+            (self.master_df['user_id'] != exclude_user_id)
+        ].sort_values('user_id').head(top_n)
+        
+        return candidates[['user_id'] + SIMILAR_METRICS].to_dict('records')
+    
+    def _similar_users_frame(self, user_data, top_n, similar_users):
+        """Similar users of a user as a frame; similar_users overrides the local candidate set"""
+        if similar_users is None:
+            similar_users = self.similar_user_candidates(
+                user_data['fitness_level'], user_data['age'], user_data['user_id'], top_n
+            )
+        return pd.DataFrame(similar_users, columns=['user_id'] + SIMILAR_METRICS)
+    
+    def similar_users_summary(self, user_id, top_n=5, similar_users=None):
+        """Compare user with similar users in their fitness level, without plotting
+
+        similar_users overrides the local candidate set, e.g. with candidates merged across shards.
+        """
+        user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
+        similar_users = self._similar_users_frame(user_data, top_n, similar_users)
+        
+        comparison = {'similar_users': similar_users['user_id'].tolist(), 'metrics': {}}
+        for metric in SIMILAR_METRICS:
+            user_value = user_data[metric]
+            comparison['metrics'][metric] = {
+                'you': user_value,
+                'similar_avg': similar_users[metric].mean(),
+                'percentile': (similar_users[metric] < user_value).mean() * 100
+            }
+        
+        return comparison
+    
+    def compare_with_similar_users(self, user_id, top_n=5, similar_users=None):
         """Compare user with similar users in their fitness level"""
         user_data = self.master_df[self.master_df['user_id'] == user_id].iloc[0]
         user_profile = self.get_user_profile(user_id)
         
         # Find similar users (same fitness level, similar age)
-        similar_users = self.master_df[
-            (self.master_df['fitness_level'] == user_data['fitness_level']) &
-            (abs(self.master_df['age'] - user_data['age']) <= 5) &
-            (self.master_df['user_id'] != user_id)
-        ].head(top_n)
+        similar_users = self._similar_users_frame(user_data, top_n, similar_users)
+        comparison = self.similar_users_summary(user_id, similar_users=similar_users.to_dict('records'))
         
         # Create comparison chart
         fig, axes = plt.subplots(2, 2, figsize=(12, 10))
         fig.suptitle(f"Comparison with Similar Users - {user_profile['basic_info']['name']}")
         
-        metrics = ['total_steps', 'total_calories_burned', 'total_active_minutes', 'health_score']
+        metrics = SIMILAR_METRICS
         titles = ['Weekly Steps', 'Weekly Calories', 'Active Minutes', 'Health Score']
         
         for i, (metric, title) in enumerate(zip(metrics, titles)):
@@ -514,15 +935,15 @@ class UserAnalytics:
         
         plt.tight_layout()
         plt.show()
+        plt.close(fig)
         
         # Print comparison summary
         print(f"\n🤝 Comparison with {len(similar_users)} similar users:")
         for metric, title in zip(metrics, titles):
-            user_value = user_data[metric]
-            similar_avg = similar_users[metric].mean()
-            percentile = (similar_users[metric] < user_value).mean() * 100
-            
-            print(f"{title}: {user_value:.0f} (vs avg {similar_avg:.0f}) - {percentile:.0f}th percentile")
+            stats = comparison['metrics'][metric]
+            print(f"{title}: {stats['you']:.0f} (vs avg {stats['similar_avg']:.0f}) - {stats['percentile']:.0f}th percentile")
+        
+        return comparison
     
     def create_goal_tracker(self, user_id, goals=None):
         """Create goal tracking visualization"""